@@ -0,0 +1,40 @@
+"""add song fingerprint_version
+
+Revision ID: 4f0d2a6c9e15
+Revises: 7c3e9b2f41a8
+Create Date: 2026-10-19 11:40:05.271930
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4f0d2a6c9e15"
+down_revision: Union[str, Sequence[str], None] = "7c3e9b2f41a8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "songs", sa.Column("fingerprint_version", sa.Integer(), nullable=True)
+    )
+    # everything fingerprinted so far used the original parameters
+    op.execute(
+        "UPDATE songs SET fingerprint_version = 1 WHERE fingerprinted IS TRUE"
+    )
+    op.create_index(
+        "ix_fingerprints_song_id", "fingerprints", ["song_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_fingerprints_song_id", table_name="fingerprints")
+    with op.batch_alter_table("songs") as batch_op:
+        batch_op.drop_column("fingerprint_version")
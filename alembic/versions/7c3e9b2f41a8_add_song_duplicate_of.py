@@ -0,0 +1,35 @@
+"""add song duplicate_of
+
+Revision ID: 7c3e9b2f41a8
+Revises: d1a650eefbda
+Create Date: 2026-10-19 10:12:41.518203
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7c3e9b2f41a8"
+down_revision: Union[str, Sequence[str], None] = "d1a650eefbda"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("songs") as batch_op:
+        batch_op.add_column(sa.Column("duplicate_of_id", sa.UUID(), nullable=True))
+        batch_op.create_foreign_key(
+            "fk_songs_duplicate_of_id_songs", "songs", ["duplicate_of_id"], ["id"]
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("songs") as batch_op:
+        batch_op.drop_constraint("fk_songs_duplicate_of_id_songs", type_="foreignkey")
+        batch_op.drop_column("duplicate_of_id")
@@ -0,0 +1,40 @@
+"""add fingerprint_migrations
+
+Revision ID: b8e41d07c3a2
+Revises: 4f0d2a6c9e15
+Create Date: 2026-10-19 16:02:17.904113
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b8e41d07c3a2"
+down_revision: Union[str, Sequence[str], None] = "4f0d2a6c9e15"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "fingerprint_migrations",
+        sa.Column("target_version", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("running", sa.Boolean(), nullable=False),
+        sa.Column("reindexed", sa.Integer(), nullable=False),
+        sa.Column("missing_audio", sa.Integer(), nullable=False),
+        sa.Column("failed", sa.Integer(), nullable=False),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("target_version"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("fingerprint_migrations")
@@ -0,0 +1,135 @@
+import asyncio
+import gc
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import librosa
+from scipy.ndimage import maximum_filter
+
+from services.fingerprint_service import (
+    AsyncFingerprintEngine,
+    TARGET_SR,
+    FFT_WINDOW_SIZE,
+    HOP_LENGTH,
+    PEAK_NEIGHBORHOOD_SIZE,
+    DEFAULT_AMP_MIN,
+    DSP_THREADS,
+)
+
+REPEATS = 20
+# concurrent burst: recognize-length clips mixed with full-song ingests
+BURST_ROUNDS = 3
+BURST_CLIPS = 8
+BURST_SONGS = 2
+
+
+def legacy_peaks(y):
+    # the pipeline before the float32 path: librosa.stft, np.abs, and
+    # maximum_filter / mask / argwhere each allocating a full-size array
+    spectrogram = np.abs(librosa.stft(y, n_fft=FFT_WINDOW_SIZE, hop_length=HOP_LENGTH))
+    struct = np.ones((PEAK_NEIGHBORHOOD_SIZE, PEAK_NEIGHBORHOOD_SIZE), dtype=bool)
+    local_max = maximum_filter(spectrogram, footprint=struct)
+    detected_peaks = (spectrogram == local_max) & (spectrogram > DEFAULT_AMP_MIN)
+    return [(int(coord[1]), int(coord[0])) for coord in np.argwhere(detected_peaks)]
+
+
+def synthetic_audio(seconds):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * TARGET_SR)) / TARGET_SR
+    y = 0.1 * rng.normal(size=len(t))
+    for i in range(int(seconds * 4)):
+        f = rng.uniform(200, 4000)
+        y += np.sin(2 * np.pi * f * t) * np.exp(-((t - i * 0.25 - 0.1) ** 2) / 0.005)
+    return (y / np.abs(y).max()).astype(np.float32)
+
+
+def current_rss_mib():
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_single(path, seconds):
+    engine = AsyncFingerprintEngine()
+    y = synthetic_audio(seconds)
+
+    if path == "legacy":
+        def peaks():
+            return legacy_peaks(y)
+    else:
+        def peaks():
+            return engine._extract_peaks_sync(y)
+
+    peaks()  # warm up, first call sizes the scratch buffers
+    baseline_rss = peak_rss_mib()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        peaks()
+    elapsed = (time.perf_counter() - start) / REPEATS
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{path:>9} {seconds:>5}s clip: {elapsed * 1000:8.1f} ms/call, "
+        f"peak numpy allocations {peak_traced / 2**20:7.1f} MiB, "
+        f"peak RSS {peak_rss_mib():7.1f} MiB "
+        f"(+{peak_rss_mib() - baseline_rss:.1f} after warm-up)"
+    )
+
+
+def run_burst(path):
+    engine = AsyncFingerprintEngine()
+    clip = synthetic_audio(10)
+    song = synthetic_audio(240)
+
+    async def fingerprint(y):
+        if path == "legacy":
+            return await asyncio.to_thread(legacy_peaks, y)
+        return await engine.extract_peaks(y)
+
+    async def burst():
+        inputs = [clip] * BURST_CLIPS + [song] * BURST_SONGS
+        for _ in range(BURST_ROUNDS):
+            await asyncio.gather(*(fingerprint(y) for y in inputs))
+
+    gc.collect()
+    before = current_rss_mib()
+    start = time.perf_counter()
+    asyncio.run(burst())
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    after = current_rss_mib()
+
+    print(
+        f"{path:>9} burst ({BURST_CLIPS} x 10s + {BURST_SONGS} x 240s, "
+        f"{BURST_ROUNDS} rounds): {elapsed:6.1f} s, peak RSS {peak_rss_mib():7.1f} "
+        f"MiB, still resident afterwards +{after - before:.1f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run_single(sys.argv[1], float(sys.argv[2]))
+    elif len(sys.argv) == 2:
+        run_burst(sys.argv[1])
+    else:
+        # each measurement in a fresh process so peak RSS is not shared
+        print(f"DSP threads: {DSP_THREADS}")
+        for seconds in (10, 240):
+            for path in ("legacy", "optimized"):
+                subprocess.run([sys.executable, __file__, path, str(seconds)])
+        for path in ("legacy", "optimized"):
+            subprocess.run([sys.executable, __file__, path])
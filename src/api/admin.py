@@ -0,0 +1,98 @@
+from typing import List
+from uuid import UUID
+from fastapi import (
+    UploadFile,
+    File,
+    Body,
+    Query,
+    BackgroundTasks,
+    HTTPException,
+    APIRouter,
+)
+import logging
+
+from services.catalog_service import catalog_service
+from services.fingerprint_service import FINGERPRINT_VERSION
+from services.scheduler_service import SchedulerOverloadedError
+from api.routes import overloaded_response
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.post("/songs/delete")
+async def delete_songs(song_ids: List[UUID] = Body(..., embed=True)):
+    try:
+        return await catalog_service.delete_songs(song_ids)
+    except Exception as e:
+        logger.error(f"Error deleting songs: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to delete songs")
+
+
+@router.post("/songs/reindex")
+async def reindex_songs(
+    background_tasks: BackgroundTasks, song_ids: List[UUID] = Body(..., embed=True)
+):
+    background_tasks.add_task(catalog_service.reindex_songs, song_ids)
+    return {"message": "Reindex started", "status": "processing", "songs": song_ids}
+
+
+@router.post("/songs/{song_id}/reindex")
+async def reindex_song_from_upload(song_id: UUID, file: UploadFile = File(...)):
+    if not file.content_type or not file.content_type.startswith("audio/"):
+        raise HTTPException(
+            status_code=400, detail="Invalid file type. Please upload an audio file."
+        )
+
+    try:
+        audio_data = await file.read()
+        outcome = await catalog_service.reindex_song(song_id, audio_data)
+    except SchedulerOverloadedError as e:
+        raise overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error reindexing song {song_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Reindex failed")
+
+    if outcome == "not_found":
+        raise HTTPException(status_code=404, detail="Song not found")
+    if outcome == "duplicate":
+        raise HTTPException(
+            status_code=409,
+            detail="Song is a duplicate, reindex the song it points at instead",
+        )
+    if outcome == "failed":
+        raise HTTPException(status_code=422, detail="Could not fingerprint audio")
+    return {"song_id": song_id, "status": outcome}
+
+
+@router.post("/migrate")
+async def start_migration():
+    try:
+        started = await catalog_service.start_migration()
+        status = await catalog_service.get_migration_status()
+    except Exception as e:
+        logger.error(f"Error starting migration: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to start migration")
+
+    return {"started": started, **status, "current_version": FINGERPRINT_VERSION}
+
+
+@router.get("/migrate")
+async def get_migration_status():
+    try:
+        status = await catalog_service.get_migration_status()
+    except Exception as e:
+        logger.error(f"Error getting migration status: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get status")
+
+    return {**status, "current_version": FINGERPRINT_VERSION}
+
+
+@router.post("/compact")
+async def compact_catalog(vacuum: bool = Query(False)):
+    try:
+        return await catalog_service.compact(vacuum)
+    except Exception as e:
+        logger.error(f"Error compacting catalog: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Compaction failed")
@@ -14,44 +14,102 @@ import logging
 from database import get_async_session, engine
 from services.database_service import db_service
 from services.recognition_service import recognition_service
-from services.fingerprint_service import fingerprint_engine
+from services.fingerprint_service import fingerprint_engine, FINGERPRINT_VERSION
+from services.catalog_service import catalog_service
+from services.song_cache_service import song_cache
+from services.scheduler_service import (
+    job_scheduler,
+    SchedulerOverloadedError,
+    LANE_RECOGNIZE,
+    LANE_INGEST,
+    RECOGNIZE_QUEUE_TIMEOUT,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+OVERLOAD_RETRY_AFTER_SECONDS = 1
+
+
+def overloaded_response(e: SchedulerOverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Server is busy ({e}). Please retry shortly.",
+        headers={"Retry-After": str(OVERLOAD_RETRY_AFTER_SECONDS)},
+    )
+
 
 async def process_audio_ingestion(
-    audio_data: bytes, title: str, artist: str, file_hash: str
+    audio_data: bytes,
+    title: str,
+    artist: str,
+    file_hash: str,
+    allow_duplicate: bool = False,
 ):
     try:
-        async with AsyncSession(engine) as session:
-            existing_song = await db_service.get_song_by_hash(session, file_hash)
-            if existing_song:
-                logger.info(f"Song with hash {file_hash} already exists. Skipping.")
+        # the queue place was reserved by ingest_audio before it answered
+        async with job_scheduler.admit(LANE_INGEST, reserved=True):
+            async with AsyncSession(engine) as session:
+                existing_song = await db_service.get_song_by_hash(session, file_hash)
+                if existing_song:
+                    logger.info(
+                        f"Song with hash {file_hash} already exists. Skipping."
+                    )
+                    return
+
+            logger.info(f"Generating fingerprints for new song '{title}'...")
+            fingerprints = await fingerprint_engine.fingerprint_audio(audio_data)
+            if not fingerprints:
+                logger.error(f"Failed to generate fingerprints for song '{title}'.")
                 return
-
-        logger.info(f"Generating fingerprints for new song '{title}'...")
-        fingerprints = await fingerprint_engine.fingerprint_audio(audio_data)
-        if not fingerprints:
-            logger.error(f"Failed to generate fingerprints for song '{title}'.")
-            return
-        logger.info(f"Generated {len(fingerprints)} fingerprints.")
-
-        logger.info("Writing song and fingerprints to the database...")
-        async with AsyncSession(engine) as session:
-            async with session.begin():
-                song = await db_service.create_song(
-                    session, title, artist, file_hash=file_hash
-                )
-                await db_service.bulk_insert_fingerprints(
-                    session, song.id, fingerprints
-                )
-                await db_service.set_song_fingerprinted(session, song.id)
-
-        logger.info(f"Successfully processed and committed song '{title}'.")
-
+            logger.info(f"Generated {len(fingerprints)} fingerprints.")
+
+            if not allow_duplicate:
+                async with AsyncSession(engine) as session:
+                    duplicate = await recognition_service.find_duplicate(
+                        session, fingerprints
+                    )
+                if duplicate:
+                    logger.info(
+                        f"Song '{title}' duplicates '{duplicate['title']}' "
+                        f"({duplicate['song_id']}, confidence "
+                        f"{duplicate['confidence']:.2f}). Linking it instead of "
+                        "storing fingerprints."
+                    )
+                    async with AsyncSession(engine) as session:
+                        async with session.begin():
+                            await db_service.create_song(
+                                session,
+                                title,
+                                artist,
+                                file_hash=file_hash,
+                                duplicate_of_id=duplicate["song_id"],
+                            )
+                    await catalog_service.store_audio(file_hash, audio_data)
+                    return
+
+            logger.info("Writing song and fingerprints to the database...")
+            async with AsyncSession(engine) as session:
+                async with session.begin():
+                    song = await db_service.create_song(
+                        session, title, artist, file_hash=file_hash
+                    )
+                    await db_service.bulk_insert_fingerprints(
+                        session, song.id, fingerprints
+                    )
+                    await db_service.set_song_fingerprinted(
+                        session, song.id, FINGERPRINT_VERSION
+                    )
+                    song_id = song.id
+            song_cache.put(song_id, title, artist)
+            await catalog_service.store_audio(file_hash, audio_data)
+
+            logger.info(f"Successfully processed and committed song '{title}'.")
+
+    except SchedulerOverloadedError as e:
+        logger.error(f"Dropping ingestion of '{title}': {e}")
     except Exception as e:
         logger.error(f"Error in background audio processing: {e}", exc_info=True)
 
@@ -69,7 +127,10 @@ async def recognize_audio(
         audio_data = await audio.read()
         logger.info(f"Processing recognition request for file: {audio.filename}")
 
-        result = await recognition_service.recognize_audio(session, audio_data)
+        async with job_scheduler.admit(
+            LANE_RECOGNIZE, timeout=RECOGNIZE_QUEUE_TIMEOUT
+        ):
+            result = await recognition_service.recognize_audio(session, audio_data)
 
         if result:
             return {
@@ -79,11 +140,26 @@ async def recognize_audio(
                     "artist": result["artist"],
                     "confidence": result["confidence"],
                     "aligned_matches": result["aligned_matches"],
+                    "offset_seconds": result["offset_seconds"],
+                    "margin": result["margin"],
                 },
+                "candidates": [
+                    {
+                        "title": candidate["title"],
+                        "artist": candidate["artist"],
+                        "confidence": candidate["confidence"],
+                        "aligned_matches": candidate["aligned_matches"],
+                        "offset_seconds": candidate["offset_seconds"],
+                    }
+                    for candidate in result["candidates"]
+                ],
             }
         else:
             return {"match_found": False}
 
+    except SchedulerOverloadedError as e:
+        logger.warning(f"Rejecting recognition request: {e}")
+        raise overloaded_response(e)
     except Exception as e:
         logger.error(f"Error in recognition: {e}")
         raise HTTPException(status_code=500, detail="Recognition failed")
@@ -95,19 +171,30 @@ async def ingest_audio(
     title: str = Form(...),
     artist: str = Form(...),
     file: UploadFile = File(...),
+    allow_duplicate: bool = Form(False),
 ):
     if not file.content_type or not file.content_type.startswith("audio/"):
         raise HTTPException(
             status_code=400, detail="Invalid file type. Please upload an audio file."
         )
 
+    try:
+        job_scheduler.reserve(LANE_INGEST)
+    except SchedulerOverloadedError as e:
+        raise overloaded_response(e)
+
     try:
         audio_data = await file.read()
 
         file_hash = hashlib.sha256(audio_data).hexdigest()
 
         background_tasks.add_task(
-            process_audio_ingestion, audio_data, title, artist, file_hash
+            process_audio_ingestion,
+            audio_data,
+            title,
+            artist,
+            file_hash,
+            allow_duplicate,
         )
 
         return {
@@ -117,6 +204,7 @@ async def ingest_audio(
         }
 
     except Exception as e:
+        job_scheduler.cancel_reservation(LANE_INGEST)
         logger.error(f"Error in ingestion: {e}")
         raise HTTPException(status_code=500, detail="Ingestion failed")
 
@@ -137,3 +225,8 @@ async def get_stats(session: AsyncSession = Depends(get_async_session)):
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         raise HTTPException(status_code=500, detail="Failed to get stats")
+
+
+@router.get("/scheduler")
+async def get_scheduler_metrics():
+    return job_scheduler.metrics()
@@ -7,12 +7,22 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_ECHO = (os.getenv("DB_ECHO") or "true").lower() == "true"
 print(f"Using database URL: {DATABASE_URL}")
+
+# per-process pool size, the production launcher splits a total across workers
+pool_options = {}
+if os.getenv("DB_POOL_SIZE"):
+    pool_options["pool_size"] = int(os.getenv("DB_POOL_SIZE"))
+if os.getenv("DB_MAX_OVERFLOW"):
+    pool_options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW"))
+
 engine = create_async_engine(
     DATABASE_URL,
-    echo=True,  # set to False in production
+    echo=DB_ECHO,  # set DB_ECHO=false in production
     future=True,
     pool_pre_ping=True,
+    **pool_options,
 )
 
 async_session_factory = sessionmaker(
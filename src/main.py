@@ -3,8 +3,10 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 import logging
 
-from database import engine
+from database import engine, async_session_factory
 from api.routes import router as api_router
+from api.admin import router as admin_router
+from services.song_cache_service import song_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,6 +15,10 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting up async Shazam clone...")
+    # the production launcher warms the cache once before forking workers
+    if not song_cache.is_warm:
+        async with async_session_factory() as session:
+            await song_cache.warm(session)
     yield
     logger.info("Shutting down...")
     await engine.dispose()
@@ -26,6 +32,7 @@ app = FastAPI(
 )
 
 app.include_router(api_router, prefix="/api", tags=["audio"])
+app.include_router(admin_router, prefix="/api/admin", tags=["admin"])
 
 app.mount("/", StaticFiles(directory="website", html=True), name="static")
 
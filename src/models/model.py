@@ -18,7 +18,11 @@ class Song(Base):
     album = Column(String(255))
     duration = Column(Integer)  # in seconds
     fingerprinted = Column(Boolean, default=False)
+    # FINGERPRINT_VERSION the stored fingerprints were generated with
+    fingerprint_version = Column(Integer)
     file_hash = Column(String(64), unique=True, index=True)
+    # set when ingest found this to be another encoding of an existing song
+    duplicate_of_id = Column(UUID(as_uuid=True), ForeignKey("songs.id"))
 
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, onupdate=func.now())
@@ -26,6 +30,7 @@ class Song(Base):
     fingerprints = relationship(
         "Fingerprint", back_populates="song", cascade="all, delete-orphan"
     )
+    duplicate_of = relationship("Song", remote_side=[id])
 
 
 class Fingerprint(Base):
@@ -38,4 +43,24 @@ class Fingerprint(Base):
 
     song = relationship("Song", back_populates="fingerprints")
 
-    __table_args__ = (Index("idx_hash_song", "hash", "song_id"),)
+    __table_args__ = (
+        Index("idx_hash_song", "hash", "song_id"),
+        # per-song deletes and reindexes, and the FK check on song deletes
+        Index("ix_fingerprints_song_id", "song_id"),
+    )
+
+
+class FingerprintMigration(Base):
+    # one row per FINGERPRINT_VERSION, shared by every worker process
+    __tablename__ = "fingerprint_migrations"
+
+    target_version = Column(Integer, primary_key=True, autoincrement=False)
+    running = Column(Boolean, nullable=False, default=False)
+    reindexed = Column(Integer, nullable=False, default=0)
+    missing_audio = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    # refreshed by the process running the migration, a stale heartbeat means
+    # that process died and another one may take the migration over
+    heartbeat_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
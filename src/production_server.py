@@ -0,0 +1,182 @@
+"""Pre-forking production launcher.
+
+The app and its in-process caches are loaded once in the master process,
+then WORKERS processes are forked sharing one listening socket. Everything
+loaded before the fork is shared copy-on-write between the workers.
+Anything the workers must agree on, such as the fingerprint migration's
+state, lives in the database rather than in process memory.
+"""
+
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("production_server")
+
+WORKERS = int(os.getenv("WORKERS") or os.cpu_count() or 1)
+HOST = os.getenv("HOST") or "0.0.0.0"
+PORT = int(os.getenv("PORT") or 8085)
+# connections across all workers, keep below the database's max_connections
+DB_POOL_TOTAL = int(os.getenv("DB_POOL_TOTAL") or 20)
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT") or 30)
+WORKER_MIN_UPTIME = 10
+WORKER_MAX_RESTART_DELAY = 30
+WORKER_STARTUP_FAILURE = 3
+
+
+def configure_worker_env(workers: int) -> None:
+    # read by database.py and scheduler_service.py at import time
+    pool_size = max(1, DB_POOL_TOTAL // workers)
+    os.environ.setdefault("DB_POOL_SIZE", str(pool_size))
+    os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+    os.environ.setdefault("DB_ECHO", "false")
+    # DSP holds the GIL, more than a couple of jobs per worker only queues
+    os.environ.setdefault("SCHEDULER_MAX_CONCURRENCY", str(min(2, pool_size)))
+
+
+def preload_app():
+    from main import app
+    from database import engine, async_session_factory
+    from services.song_cache_service import song_cache
+
+    async def warm():
+        async with async_session_factory() as session:
+            await song_cache.warm(session)
+        # workers must not inherit open connections
+        await engine.dispose()
+
+    asyncio.run(warm())
+
+    # move everything loaded so far out of the collector's reach, so gc passes
+    # in the workers don't touch (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def create_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket) -> bool:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    config = uvicorn.Config(
+        app,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        log_level="info",
+    )
+    # uvicorn drains in-flight requests on SIGTERM before exiting
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+    return server.started
+
+
+def spawn_worker(app, sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 1
+        try:
+            # a failed lifespan startup returns without raising
+            exit_code = 0 if run_worker(app, sock) else WORKER_STARTUP_FAILURE
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            logger.exception("Worker crashed")
+        finally:
+            os._exit(exit_code)
+    logger.info(f"Started worker {pid}")
+    return pid
+
+
+def serve(workers: int) -> None:
+    configure_worker_env(workers)
+    app = preload_app()
+    sock = create_socket()
+    logger.info(f"Listening on {HOST}:{PORT} with {workers} workers")
+
+    # pid -> start time
+    children = {spawn_worker(app, sock): time.monotonic() for _ in range(workers)}
+    pending_restarts = []
+    restart_delay = 0.0
+    shutting_down = False
+
+    def stop(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        logger.info("Draining workers...")
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    deadline = None
+    while children or (pending_restarts and not shutting_down):
+        now = time.monotonic()
+        if shutting_down and deadline is None:
+            deadline = now + GRACEFUL_TIMEOUT + 5
+
+        while not shutting_down and pending_restarts and pending_restarts[0] <= now:
+            pending_restarts.pop(0)
+            children[spawn_worker(app, sock)] = time.monotonic()
+
+        pid, status = os.waitpid(-1, os.WNOHANG) if children else (0, 0)
+        if pid == 0:
+            if deadline is not None and now > deadline:
+                for pid in list(children):
+                    logger.warning(f"Worker {pid} did not drain in time, killing")
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                deadline = float("inf")
+            time.sleep(0.5)
+            continue
+
+        started_at = children.pop(pid)
+        if shutting_down:
+            continue
+
+        # a worker dying right after start will most likely die again, back off
+        # instead of fork-looping
+        if now - started_at < WORKER_MIN_UPTIME:
+            restart_delay = min(max(1.0, restart_delay * 2), WORKER_MAX_RESTART_DELAY)
+        else:
+            restart_delay = 0.0
+        logger.warning(
+            f"Worker {pid} exited with code {os.waitstatus_to_exitcode(status)}, "
+            f"restarting in {restart_delay:.0f}s"
+        )
+        pending_restarts.append(now + restart_delay)
+        pending_restarts.sort()
+
+    sock.close()
+    logger.info("All workers stopped")
+
+
+if __name__ == "__main__":
+    if not hasattr(os, "fork"):
+        # no fork on Windows: uvicorn's own worker manager, without sharing
+        configure_worker_env(WORKERS)
+        uvicorn.run("main:app", host=HOST, port=PORT, workers=WORKERS)
+        sys.exit(0)
+
+    serve(WORKERS)
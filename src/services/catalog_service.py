@@ -0,0 +1,391 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Optional, Dict, Any
+from uuid import UUID
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import engine
+from models.model import Song
+from services.database_service import db_service, FINGERPRINT_DELETE_BATCH_SIZE
+from services.fingerprint_service import fingerprint_engine, FINGERPRINT_VERSION
+from services.scheduler_service import job_scheduler, LANE_INGEST
+from services.song_cache_service import song_cache
+
+logger = logging.getLogger(__name__)
+
+# originals are kept here (named by file hash) so songs can be reindexed
+# without re-uploading them; reindexing needs an upload when unset
+AUDIO_STORE_DIR = os.getenv("AUDIO_STORE_DIR")
+# audio uploaded to reindex a song, named by song id, used before the original
+REINDEX_SOURCE_DIR = "reindex"
+MIGRATION_BATCH_SIZE = 50
+# the migration runs in whichever worker claimed it in the database; another
+# worker may take it over once the heartbeat is older than the timeout
+MIGRATION_HEARTBEAT_INTERVAL = 15
+MIGRATION_HEARTBEAT_TIMEOUT = 120
+MIGRATION_OUTCOMES = ("reindexed", "missing_audio", "failed")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class AsyncCatalogService:
+    def __init__(self):
+        self._migration_task: Optional[asyncio.Task] = None
+
+    async def store_audio(self, file_hash: str, audio_data: bytes) -> None:
+        if not AUDIO_STORE_DIR:
+            return
+        path = Path(AUDIO_STORE_DIR) / file_hash
+        await asyncio.to_thread(self._write_audio_sync, path, audio_data)
+
+    async def store_reindex_source(self, song_id: UUID, audio_data: bytes) -> None:
+        if not AUDIO_STORE_DIR:
+            return
+        path = self._reindex_source_path(song_id)
+        await asyncio.to_thread(self._write_audio_sync, path, audio_data)
+
+    def _reindex_source_path(self, song_id: UUID) -> Path:
+        return Path(AUDIO_STORE_DIR) / REINDEX_SOURCE_DIR / str(song_id)
+
+    def _write_audio_sync(self, path: Path, audio_data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(audio_data)
+
+    async def discard_reindex_source(self, song_id: UUID) -> None:
+        if not AUDIO_STORE_DIR:
+            return
+        path = self._reindex_source_path(song_id)
+        await asyncio.to_thread(path.unlink, missing_ok=True)
+
+    async def _read_audio(self, path: Path) -> Optional[bytes]:
+        if not path.exists():
+            return None
+        return await asyncio.to_thread(path.read_bytes)
+
+    async def load_audio(self, file_hash: Optional[str]) -> Optional[bytes]:
+        if not AUDIO_STORE_DIR or not file_hash:
+            return None
+        return await self._read_audio(Path(AUDIO_STORE_DIR) / file_hash)
+
+    async def load_song_audio(self, song: Song) -> Optional[bytes]:
+        # the latest reindex upload if there was one, else the ingested file
+        if not AUDIO_STORE_DIR:
+            return None
+        audio_data = await self._read_audio(self._reindex_source_path(song.id))
+        if audio_data is None:
+            audio_data = await self.load_audio(song.file_hash)
+        return audio_data
+
+    async def _delete_fingerprints_batched(self, fingerprint_ids: List[UUID]) -> None:
+        # one short transaction per batch so queries keep flowing meanwhile
+        for i in range(0, len(fingerprint_ids), FINGERPRINT_DELETE_BATCH_SIZE):
+            batch = fingerprint_ids[i : i + FINGERPRINT_DELETE_BATCH_SIZE]
+            async with AsyncSession(engine) as session:
+                async with session.begin():
+                    await db_service.delete_fingerprints(session, batch)
+            await asyncio.sleep(0)
+
+    async def _promote_duplicate(self, duplicate_ids: List[UUID]) -> Optional[UUID]:
+        # a duplicate has no fingerprints of its own, so one of them is
+        # reindexed from its stored audio to take over before the song it
+        # points at goes away, and the others are linked to it
+        for duplicate_id in duplicate_ids:
+            async with AsyncSession(engine) as session:
+                duplicate = await db_service.get_song(session, duplicate_id)
+            audio_data = await self.load_song_audio(duplicate)
+            if audio_data is None:
+                continue
+
+            original_id = duplicate.duplicate_of_id
+            async with AsyncSession(engine) as session:
+                async with session.begin():
+                    await db_service.set_duplicate_of(session, [duplicate_id], None)
+            try:
+                outcome = await self.reindex_song(duplicate_id, audio_data)
+            except Exception as e:
+                logger.error(f"Error promoting song {duplicate_id}: {e}")
+                outcome = "failed"
+            if outcome != "reindexed":
+                async with AsyncSession(engine) as session:
+                    async with session.begin():
+                        await db_service.set_duplicate_of(
+                            session, [duplicate_id], original_id
+                        )
+                continue
+
+            others = [song_id for song_id in duplicate_ids if song_id != duplicate_id]
+            if others:
+                async with AsyncSession(engine) as session:
+                    async with session.begin():
+                        await db_service.set_duplicate_of(session, others, duplicate_id)
+            song_cache.put(duplicate_id, duplicate.title, duplicate.artist)
+            return duplicate_id
+
+        return None
+
+    async def delete_songs(self, song_ids: List[UUID]) -> Dict[str, Any]:
+        deleted, not_found, has_duplicates = [], [], []
+        promoted: Dict[UUID, UUID] = {}
+        for song_id in song_ids:
+            async with AsyncSession(engine) as session:
+                song = await db_service.get_song(session, song_id)
+                if song is None:
+                    not_found.append(song_id)
+                    continue
+                duplicate_ids = await db_service.get_duplicate_ids(session, song_id)
+
+            if duplicate_ids:
+                replacement_id = await self._promote_duplicate(duplicate_ids)
+                if replacement_id is None:
+                    # deleting would leave the recording unrecognizable
+                    logger.warning(
+                        f"Not deleting song {song_id}: none of its duplicates "
+                        "has stored audio to take over"
+                    )
+                    has_duplicates.append(song_id)
+                    continue
+                promoted[song_id] = replacement_id
+
+            async with AsyncSession(engine) as session:
+                fingerprint_ids = await db_service.get_fingerprint_ids(
+                    session, song_id
+                )
+
+            song_cache.discard(song_id)
+            await self._delete_fingerprints_batched(fingerprint_ids)
+            async with AsyncSession(engine) as session:
+                async with session.begin():
+                    # under the song's lock, so a reindex that inserted a new
+                    # set meanwhile can't leave fingerprints behind
+                    if await db_service.lock_song(session, song_id) is None:
+                        not_found.append(song_id)
+                        continue
+                    await db_service.delete_song_fingerprints(session, song_id)
+                    await db_service.delete_song(session, song_id)
+            await self.discard_reindex_source(song_id)
+
+            logger.info(
+                f"Deleted song {song_id} and {len(fingerprint_ids)} fingerprints"
+            )
+            deleted.append(song_id)
+
+        return {
+            "deleted": deleted,
+            "not_found": not_found,
+            "has_duplicates": has_duplicates,
+            "promoted": promoted,
+        }
+
+    async def reindex_song(
+        self, song_id: UUID, audio_data: Optional[bytes] = None
+    ) -> str:
+        async with AsyncSession(engine) as session:
+            song = await db_service.get_song(session, song_id)
+        if song is None:
+            return "not_found"
+        if song.duplicate_of_id is not None:
+            # duplicates share the fingerprints of the song they point at
+            return "duplicate"
+
+        uploaded = audio_data is not None
+        if audio_data is None:
+            audio_data = await self.load_song_audio(song)
+            if audio_data is None:
+                return "missing_audio"
+
+        async with job_scheduler.admit(LANE_INGEST):
+            fingerprints = await fingerprint_engine.fingerprint_audio(audio_data)
+            if not fingerprints:
+                logger.error(f"Failed to generate fingerprints for song {song_id}")
+                return "failed"
+
+            # old and new fingerprints are swapped in one transaction under
+            # the song's lock. Reindexes of the same song from other workers
+            # or the migration wait for each other instead of each keeping
+            # its own set, and queries see either the old or the new set
+            async with AsyncSession(engine) as session:
+                async with session.begin():
+                    locked_song = await db_service.lock_song(session, song_id)
+                    if locked_song is None:
+                        return "not_found"
+                    if locked_song.duplicate_of_id is not None:
+                        return "duplicate"
+                    replaced = await db_service.delete_song_fingerprints(
+                        session, song_id
+                    )
+                    await db_service.bulk_insert_fingerprints(
+                        session, song_id, fingerprints
+                    )
+                    await db_service.set_song_fingerprinted(
+                        session, song_id, FINGERPRINT_VERSION
+                    )
+                    if uploaded:
+                        # kept so the next version bump can reindex without
+                        # an upload. Written under the lock so the stored file
+                        # matches the fingerprints that win
+                        await self.store_reindex_source(song_id, audio_data)
+
+        logger.info(
+            f"Reindexed song {song_id}: {replaced} fingerprints "
+            f"replaced by {len(fingerprints)}"
+        )
+        return "reindexed"
+
+    async def reindex_songs(self, song_ids: List[UUID]) -> Dict[str, List[UUID]]:
+        results: Dict[str, List[UUID]] = {}
+        for song_id in song_ids:
+            try:
+                outcome = await self.reindex_song(song_id)
+            except Exception as e:
+                logger.error(f"Error reindexing song {song_id}: {e}", exc_info=True)
+                outcome = "failed"
+            results.setdefault(outcome, []).append(song_id)
+        return results
+
+    async def start_migration(self) -> bool:
+        started_at = _utcnow()
+        stale_before = started_at - timedelta(seconds=MIGRATION_HEARTBEAT_TIMEOUT)
+        try:
+            async with AsyncSession(engine) as session:
+                async with session.begin():
+                    claimed = await db_service.claim_migration(
+                        session, FINGERPRINT_VERSION, started_at, stale_before
+                    )
+                    if not claimed and (
+                        await db_service.get_migration(session, FINGERPRINT_VERSION)
+                        is None
+                    ):
+                        await db_service.create_migration(
+                            session, FINGERPRINT_VERSION, started_at
+                        )
+                        claimed = True
+        except IntegrityError:
+            # another worker created the row first
+            claimed = False
+
+        if claimed:
+            self._migration_task = asyncio.create_task(
+                self._migrate_stale_songs(started_at)
+            )
+        return claimed
+
+    async def get_migration_status(self) -> Dict[str, Any]:
+        async with AsyncSession(engine) as session:
+            migration = await db_service.get_migration(session, FINGERPRINT_VERSION)
+            stale_songs = await db_service.get_stale_songs_count(
+                session, FINGERPRINT_VERSION
+            )
+
+        status: Dict[str, Any] = {
+            "running": False,
+            "target_version": FINGERPRINT_VERSION,
+            **{outcome: 0 for outcome in MIGRATION_OUTCOMES},
+            "started_at": None,
+            "finished_at": None,
+            "stale_songs": stale_songs,
+        }
+        if migration is not None:
+            stale_before = _utcnow() - timedelta(seconds=MIGRATION_HEARTBEAT_TIMEOUT)
+            status.update(
+                running=migration.running and migration.heartbeat_at >= stale_before,
+                started_at=migration.started_at,
+                finished_at=migration.finished_at,
+                **{
+                    outcome: getattr(migration, outcome)
+                    for outcome in MIGRATION_OUTCOMES
+                },
+            )
+        return status
+
+    async def _save_migration_progress(
+        self, started_at: datetime, counts: Dict[str, int], finished: bool = False
+    ) -> bool:
+        now = _utcnow()
+        values: Dict[str, Any] = {**counts, "heartbeat_at": now}
+        if finished:
+            values.update(running=False, finished_at=now)
+        try:
+            async with AsyncSession(engine) as session:
+                async with session.begin():
+                    return await db_service.update_migration(
+                        session, FINGERPRINT_VERSION, started_at, **values
+                    )
+        except Exception as e:
+            # keep going, if the heartbeat goes stale another worker takes over
+            # and the next save reports the run as lost
+            logger.error(f"Error saving fingerprint migration progress: {e}")
+            return True
+
+    async def _migration_heartbeat(
+        self, started_at: datetime, counts: Dict[str, int]
+    ) -> None:
+        while await self._save_migration_progress(started_at, counts):
+            await asyncio.sleep(MIGRATION_HEARTBEAT_INTERVAL)
+
+    async def _migrate_stale_songs(self, started_at: datetime) -> None:
+        counts = {outcome: 0 for outcome in MIGRATION_OUTCOMES}
+        heartbeat = asyncio.create_task(self._migration_heartbeat(started_at, counts))
+        last_id = None
+        try:
+            while True:
+                async with AsyncSession(engine) as session:
+                    songs = await db_service.get_stale_songs(
+                        session, FINGERPRINT_VERSION, last_id, MIGRATION_BATCH_SIZE
+                    )
+                if not songs:
+                    break
+                last_id = songs[-1].id
+
+                results = await self.reindex_songs([song.id for song in songs])
+                for outcome in MIGRATION_OUTCOMES:
+                    counts[outcome] += len(results.get(outcome, []))
+                if not await self._save_migration_progress(started_at, counts):
+                    logger.warning(
+                        "Fingerprint migration was taken over by another worker"
+                    )
+                    return
+
+            logger.info(f"Fingerprint migration finished: {counts}")
+        except Exception as e:
+            logger.error(f"Fingerprint migration aborted: {e}", exc_info=True)
+        finally:
+            heartbeat.cancel()
+            await self._save_migration_progress(started_at, counts, finished=True)
+
+    async def compact(self, vacuum: bool = False) -> Dict[str, Any]:
+        removed = 0
+        while True:
+            async with AsyncSession(engine) as session:
+                orphan_ids = await db_service.get_orphan_fingerprint_ids(session)
+            if not orphan_ids:
+                break
+            await self._delete_fingerprints_batched(orphan_ids)
+            removed += len(orphan_ids)
+
+        # give freed pages back and refresh planner statistics. Opt-in: on
+        # SQLite this rewrites the whole file under an exclusive lock, which
+        # stalls recognition and ingestion until it finishes
+        statement = None
+        if vacuum:
+            statement = {
+                "postgresql": "VACUUM ANALYZE fingerprints",
+                "sqlite": "VACUUM",
+            }.get(engine.dialect.name)
+        if statement:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(text(statement))
+
+        logger.info(f"Compaction removed {removed} orphaned fingerprints")
+        return {"orphaned_fingerprints_removed": removed, "vacuumed": bool(statement)}
+
+
+catalog_service = AsyncCatalogService()
@@ -1,15 +1,18 @@
 import logging
 import asyncio
+from datetime import datetime
 from typing import List, Optional, Dict, Any, Tuple
+from uuid import UUID
 
-from sqlalchemy import select, insert, update, func
+from sqlalchemy import select, insert, update, delete, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from models.model import Song, Fingerprint
+from models.model import Song, Fingerprint, FingerprintMigration
 
 logger = logging.getLogger(__name__)
 
 FINGERPRINT_INSERT_BATCH_SIZE = 1000
 FINGERPRINT_SEARCH_BATCH_SIZE = 1000
+FINGERPRINT_DELETE_BATCH_SIZE = 1000
 
 
 class AsyncDatabaseService:
@@ -20,6 +23,7 @@ class AsyncDatabaseService:
         artist: Optional[str] = None,
         album: Optional[str] = None,
         file_hash: Optional[str] = None,
+        duplicate_of_id: Optional[UUID] = None,
     ) -> Song:
         song = Song(
             title=title,
@@ -27,6 +31,7 @@ class AsyncDatabaseService:
             album=album,
             file_hash=file_hash,
             fingerprinted=False,
+            duplicate_of_id=duplicate_of_id,
         )
         session.add(song)
         await session.flush()
@@ -56,10 +61,185 @@ class AsyncDatabaseService:
         if batch:
             await session.execute(insert(Fingerprint), batch)
 
-    async def set_song_fingerprinted(self, session: AsyncSession, song_id: int) -> None:
-        stmt = update(Song).where(Song.id == song_id).values(fingerprinted=True)
+    async def set_song_fingerprinted(
+        self, session: AsyncSession, song_id: int, fingerprint_version: int
+    ) -> None:
+        stmt = (
+            update(Song)
+            .where(Song.id == song_id)
+            .values(fingerprinted=True, fingerprint_version=fingerprint_version)
+        )
+        await session.execute(stmt)
+
+    async def get_song(self, session: AsyncSession, song_id: UUID) -> Optional[Song]:
+        return await session.get(Song, song_id)
+
+    async def lock_song(self, session: AsyncSession, song_id: UUID) -> Optional[Song]:
+        # a write rather than SELECT ... FOR UPDATE: it takes the row lock on
+        # PostgreSQL and the write lock right away on SQLite, where a read
+        # first can fail to upgrade while another writer holds the lock
+        stmt = update(Song).where(Song.id == song_id).values(updated_at=func.now())
+        result = await session.execute(stmt)
+        if result.rowcount == 0:
+            return None
+        return await session.get(Song, song_id)
+
+    def _stale_song_filter(self, fingerprint_version: int):
+        return Song.fingerprinted.is_(True) & (
+            Song.fingerprint_version.is_(None)
+            | (Song.fingerprint_version != fingerprint_version)
+        )
+
+    async def get_stale_songs(
+        self,
+        session: AsyncSession,
+        fingerprint_version: int,
+        after_id: Optional[UUID] = None,
+        limit: int = 100,
+    ) -> List[Song]:
+        stmt = (
+            select(Song)
+            .where(self._stale_song_filter(fingerprint_version))
+            .order_by(Song.id)
+            .limit(limit)
+        )
+        if after_id is not None:
+            stmt = stmt.where(Song.id > after_id)
+        result = await session.execute(stmt)
+        return list(result.scalars().all())
+
+    async def get_stale_songs_count(
+        self, session: AsyncSession, fingerprint_version: int
+    ) -> int:
+        stmt = select(func.count(Song.id)).where(
+            self._stale_song_filter(fingerprint_version)
+        )
+        result = await session.execute(stmt)
+        return result.scalar_one()
+
+    async def get_fingerprint_ids(
+        self, session: AsyncSession, song_id: UUID
+    ) -> List[UUID]:
+        stmt = select(Fingerprint.id).where(Fingerprint.song_id == song_id)
+        result = await session.execute(stmt)
+        return list(result.scalars().all())
+
+    async def get_orphan_fingerprint_ids(
+        self, session: AsyncSession, limit: int = FINGERPRINT_DELETE_BATCH_SIZE
+    ) -> List[UUID]:
+        stmt = (
+            select(Fingerprint.id)
+            .where(~select(Song.id).where(Song.id == Fingerprint.song_id).exists())
+            .limit(limit)
+        )
+        result = await session.execute(stmt)
+        return list(result.scalars().all())
+
+    async def delete_fingerprints(
+        self, session: AsyncSession, fingerprint_ids: List[UUID]
+    ) -> None:
+        stmt = delete(Fingerprint).where(Fingerprint.id.in_(fingerprint_ids))
         await session.execute(stmt)
 
+    async def delete_song_fingerprints(
+        self, session: AsyncSession, song_id: UUID
+    ) -> int:
+        stmt = delete(Fingerprint).where(Fingerprint.song_id == song_id)
+        result = await session.execute(stmt)
+        return result.rowcount
+
+    async def get_duplicate_ids(
+        self, session: AsyncSession, song_id: UUID
+    ) -> List[UUID]:
+        stmt = select(Song.id).where(Song.duplicate_of_id == song_id).order_by(Song.id)
+        result = await session.execute(stmt)
+        return list(result.scalars().all())
+
+    async def set_duplicate_of(
+        self,
+        session: AsyncSession,
+        song_ids: List[UUID],
+        duplicate_of_id: Optional[UUID],
+    ) -> None:
+        stmt = (
+            update(Song)
+            .where(Song.id.in_(song_ids))
+            .values(duplicate_of_id=duplicate_of_id)
+        )
+        await session.execute(stmt)
+
+    async def delete_song(self, session: AsyncSession, song_id: UUID) -> None:
+        await session.execute(delete(Song).where(Song.id == song_id))
+
+    async def get_migration(
+        self, session: AsyncSession, target_version: int
+    ) -> Optional[FingerprintMigration]:
+        return await session.get(FingerprintMigration, target_version)
+
+    async def create_migration(
+        self, session: AsyncSession, target_version: int, started_at: datetime
+    ) -> None:
+        session.add(
+            FingerprintMigration(
+                target_version=target_version,
+                running=True,
+                reindexed=0,
+                missing_audio=0,
+                failed=0,
+                heartbeat_at=started_at,
+                started_at=started_at,
+            )
+        )
+        await session.flush()
+
+    async def claim_migration(
+        self,
+        session: AsyncSession,
+        target_version: int,
+        started_at: datetime,
+        stale_before: datetime,
+    ) -> bool:
+        # a conditional update, so two processes can never both claim it
+        stmt = (
+            update(FingerprintMigration)
+            .where(
+                FingerprintMigration.target_version == target_version,
+                FingerprintMigration.running.is_(False)
+                | (FingerprintMigration.heartbeat_at < stale_before),
+            )
+            .values(
+                running=True,
+                reindexed=0,
+                missing_audio=0,
+                failed=0,
+                heartbeat_at=started_at,
+                started_at=started_at,
+                finished_at=None,
+            )
+        )
+        result = await session.execute(stmt)
+        return result.rowcount == 1
+
+    async def update_migration(
+        self,
+        session: AsyncSession,
+        target_version: int,
+        started_at: datetime,
+        **values: Any,
+    ) -> bool:
+        # started_at identifies the run, a process whose run was taken over
+        # after its heartbeat went stale no longer matches
+        stmt = (
+            update(FingerprintMigration)
+            .where(
+                FingerprintMigration.target_version == target_version,
+                FingerprintMigration.started_at == started_at,
+            )
+            .values(**values)
+        )
+        result = await session.execute(stmt)
+        return result.rowcount == 1
+
     async def search_fingerprints(
         self, session: AsyncSession, query_hashes: List[str]
     ) -> List[Dict[str, Any]]:
@@ -69,17 +249,11 @@ class AsyncDatabaseService:
         all_matches = []
         for i in range(0, len(query_hashes), FINGERPRINT_SEARCH_BATCH_SIZE):
             batch = query_hashes[i : i + FINGERPRINT_SEARCH_BATCH_SIZE]
-            stmt = (
-                select(
-                    Fingerprint.hash,
-                    Fingerprint.song_id,
-                    Fingerprint.offset,
-                    Song.title,
-                    Song.artist,
-                )
-                .join(Song, Fingerprint.song_id == Song.id)
-                .where(Fingerprint.hash.in_(batch))
-            )
+            stmt = select(
+                Fingerprint.hash,
+                Fingerprint.song_id,
+                Fingerprint.offset,
+            ).where(Fingerprint.hash.in_(batch))
 
             result = await session.execute(stmt)
             all_matches.extend(result.mappings().all())
@@ -87,8 +261,18 @@ class AsyncDatabaseService:
 
         return all_matches
 
+    async def get_song_fingerprints_count(
+        self, session: AsyncSession, song_id: UUID
+    ) -> int:
+        stmt = select(func.count(Fingerprint.id)).where(
+            Fingerprint.song_id == song_id
+        )
+        result = await session.execute(stmt)
+        return result.scalar_one()
+
     async def get_songs_count(self, session: AsyncSession) -> int:
-        stmt = select(func.count(Song.id))
+        # duplicates have no fingerprints of their own
+        stmt = select(func.count(Song.id)).where(Song.duplicate_of_id.is_(None))
         result = await session.execute(stmt)
         return result.scalar_one()
 
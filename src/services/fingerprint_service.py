@@ -1,12 +1,19 @@
 import asyncio
 import hashlib
 import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple, Optional
 import numpy as np
 import librosa
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.fft import rfft
 from scipy.ndimage import maximum_filter
+from scipy.signal import get_window
 import logging
 
+from services.scheduler_service import SCHEDULER_MAX_CONCURRENCY
+
 logger = logging.getLogger(__name__)
 
 TARGET_SR = 22050
@@ -18,9 +25,44 @@ DEFAULT_FAN_VALUE = 6
 MIN_HASH_TIME_DELTA = 0
 MAX_HASH_TIME_DELTA = 120
 FINGERPRINT_REDUCTION = 20
+# bump whenever a parameter above changes so stored songs get reindexed
+FINGERPRINT_VERSION = 1
+
+# frames windowed and transformed per rfft call, bounds the temporary buffers
+STFT_BLOCK_FRAMES = 128
+# scratch buffers are only kept for recognize-length clips (about 16 MiB per
+# DSP thread at this length); longer audio, i.e. ingests, allocates per call
+SCRATCH_MAX_SECONDS = 15
+# DSP runs on its own pool so the number of threads holding scratch buffers
+# is bounded by the scheduler's concurrency, not the default executor's size
+DSP_THREADS = SCHEDULER_MAX_CONCURRENCY
 
 
 class AsyncFingerprintEngine:
+    def __init__(self):
+        self._window = get_window("hann", FFT_WINDOW_SIZE, fftbins=True).astype(
+            np.float32
+        )
+        # per DSP thread, so concurrent requests never share a buffer
+        self._scratch = threading.local()
+        self._dsp_executor = ThreadPoolExecutor(
+            max_workers=DSP_THREADS, thread_name_prefix="dsp"
+        )
+
+    def _buffer(
+        self, name: str, shape: Tuple[int, ...], dtype, retain: bool
+    ) -> np.ndarray:
+        if not retain:
+            return np.empty(shape, dtype=dtype)
+
+        size = int(np.prod(shape))
+
+        buffer = getattr(self._scratch, name, None)
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = np.empty(size, dtype=dtype)
+            setattr(self._scratch, name, buffer)
+        return buffer[:size].reshape(shape)
+
     async def preprocess_audio(
         self, audio_data: bytes
     ) -> Optional[Tuple[np.ndarray, int]]:
@@ -35,29 +77,67 @@ class AsyncFingerprintEngine:
             return None
 
     def _load_audio_sync(self, file_path_or_stream) -> Tuple[np.ndarray, int]:
-        y, sr = librosa.load(file_path_or_stream, sr=TARGET_SR, mono=True)
+        y, sr = librosa.load(
+            file_path_or_stream, sr=TARGET_SR, mono=True, dtype=np.float32
+        )
         y = librosa.util.normalize(y)
         return y, sr
 
-    async def generate_spectrogram(self, y: np.ndarray) -> np.ndarray:
-        return await asyncio.to_thread(self._generate_spectrogram_sync, y)
-
-    def _generate_spectrogram_sync(self, y: np.ndarray) -> np.ndarray:
-        stft_matrix = librosa.stft(y, n_fft=FFT_WINDOW_SIZE, hop_length=HOP_LENGTH)
-        return np.abs(stft_matrix)
-
-    async def find_peaks(self, spectrogram: np.ndarray) -> List[Tuple[int, int]]:
-        return await asyncio.to_thread(self._find_peaks_sync, spectrogram)
-
-    def _find_peaks_sync(self, spectrogram: np.ndarray) -> List[Tuple[int, int]]:
-        struct = np.ones((PEAK_NEIGHBORHOOD_SIZE, PEAK_NEIGHBORHOOD_SIZE), dtype=bool)
-        local_max = maximum_filter(spectrogram, footprint=struct)
-
-        detected_peaks = (spectrogram == local_max) & (spectrogram > DEFAULT_AMP_MIN)
-        peak_coords = np.argwhere(detected_peaks)
-
-        # (time_idx, freq_idx) tuples
-        return [(int(coord[1]), int(coord[0])) for coord in peak_coords]
+    async def extract_peaks(self, y: np.ndarray) -> List[Tuple[int, int]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._dsp_executor, self._extract_peaks_sync, y
+        )
+
+    def _extract_peaks_sync(self, y: np.ndarray) -> List[Tuple[int, int]]:
+        # spectrogram and peak picking run in one call on purpose: the scratch
+        # buffers belong to this thread and must not outlive it
+        retain = len(y) <= SCRATCH_MAX_SECONDS * TARGET_SR
+        magnitude = self._magnitude_sync(y, retain)
+
+        local_max = self._buffer("local_max", magnitude.shape, np.float32, retain)
+        maximum_filter(magnitude, size=PEAK_NEIGHBORHOOD_SIZE, output=local_max)
+
+        detected_peaks = self._buffer(
+            "detected_peaks", magnitude.shape, np.bool_, retain
+        )
+        loud_enough = self._buffer("loud_enough", magnitude.shape, np.bool_, retain)
+        np.equal(magnitude, local_max, out=detected_peaks)
+        np.greater(magnitude, DEFAULT_AMP_MIN, out=loud_enough)
+        np.logical_and(detected_peaks, loud_enough, out=detected_peaks)
+
+        time_idx, freq_idx = np.nonzero(detected_peaks)
+        return list(zip(time_idx.tolist(), freq_idx.tolist()))
+
+    def _magnitude_sync(self, y: np.ndarray, retain: bool = False) -> np.ndarray:
+        # float32 |STFT| laid out (time, freq), framed exactly like librosa.stft
+        y = np.asarray(y, dtype=np.float32)
+        pad = FFT_WINDOW_SIZE // 2
+        n_frames = 1 + len(y) // HOP_LENGTH
+        n_bins = 1 + FFT_WINDOW_SIZE // 2
+
+        padded = self._buffer("padded", (len(y) + 2 * pad,), np.float32, retain)
+        padded[:pad] = 0
+        padded[pad : pad + len(y)] = y
+        padded[pad + len(y) :] = 0
+        frames = sliding_window_view(padded, FFT_WINDOW_SIZE)[::HOP_LENGTH]
+
+        magnitude = self._buffer("magnitude", (n_frames, n_bins), np.float32, retain)
+        block_frames = min(STFT_BLOCK_FRAMES, n_frames)
+        windowed = self._buffer(
+            "windowed", (block_frames, FFT_WINDOW_SIZE), np.float32, retain
+        )
+
+        for start in range(0, n_frames, block_frames):
+            stop = min(start + block_frames, n_frames)
+            count = stop - start
+            np.multiply(frames[start:stop], self._window, out=windowed[:count])
+            # scipy transforms float32 natively (numpy.fft round-trips through
+            # float64); only the block's complex64 result is allocated
+            spectrum = rfft(windowed[:count], axis=-1, overwrite_x=True)
+            np.abs(spectrum, out=magnitude[start:stop])
+
+        return magnitude
 
     async def generate_hashes(
         self, peaks: List[Tuple[int, int]]
@@ -93,9 +173,7 @@ class AsyncFingerprintEngine:
 
             y, sr = audio_result
 
-            spectrogram = await self.generate_spectrogram(y)
-
-            peaks = await self.find_peaks(spectrogram)
+            peaks = await self.extract_peaks(y)
 
             hashes = await self.generate_hashes(peaks)
 
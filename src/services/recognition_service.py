@@ -1,48 +1,133 @@
 import asyncio
-from collections import defaultdict, Counter
 from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
 from services.database_service import db_service
-from services.fingerprint_service import fingerprint_engine
+from services.fingerprint_service import fingerprint_engine, HOP_LENGTH, TARGET_SR
+from services.song_cache_service import song_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_TOP_K = 5
+# a full track matching an existing song this strongly is treated as the same
+# recording (re-encode, different bitrate, remaster) rather than a new one.
+# Both tracks must be covered, otherwise an excerpt or a preview of a catalog
+# song would count as a duplicate of it
+DUPLICATE_CONFIDENCE_THRESHOLD = 0.2
+DUPLICATE_COVERAGE_THRESHOLD = 0.2
+DUPLICATE_MIN_ALIGNED_MATCHES = 50
+# the best aligned song can fail the coverage test (a long mix containing the
+# track) while a real duplicate ranks just below it
+DUPLICATE_CANDIDATES = 5
+
 
 class AsyncRecognitionService:
     async def recognize_audio(
-        self, session: AsyncSession, audio_data: bytes, min_match_count: int = 5
+        self,
+        session: AsyncSession,
+        audio_data: bytes,
+        min_match_count: int = 5,
+        top_k: int = DEFAULT_TOP_K,
     ) -> Optional[Dict[str, Any]]:
         try:
             query_fingerprints = await fingerprint_engine.fingerprint_audio(audio_data)
             if not query_fingerprints:
                 return None
 
-            query_hashes = [fp[0] for fp in query_fingerprints]
-            logger.info(f"Searching with {len(query_hashes)} query hashes")
-
-            matches = await db_service.search_fingerprints(session, query_hashes)
-
-            if not matches:
+            candidates = await self.match_fingerprints(
+                session, query_fingerprints, min_match_count, top_k
+            )
+            if not candidates:
                 return None
 
-            best_match = await self._analyze_matches(
-                query_fingerprints, matches, min_match_count
+            best_match = dict(candidates[0])
+            runner_up_confidence = (
+                candidates[1]["confidence"] if len(candidates) > 1 else 0
             )
+            best_match["margin"] = best_match["confidence"] - runner_up_confidence
+            best_match["candidates"] = candidates
             return best_match
 
         except Exception as e:
             logger.error(f"Error in audio recognition: {e}")
             return None
 
+    async def match_fingerprints(
+        self,
+        session: AsyncSession,
+        query_fingerprints: List[Tuple[str, int]],
+        min_match_count: int = 5,
+        top_k: int = DEFAULT_TOP_K,
+    ) -> List[Dict[str, Any]]:
+        query_hashes = [fp[0] for fp in query_fingerprints]
+        logger.info(f"Searching with {len(query_hashes)} query hashes")
+
+        matches = await db_service.search_fingerprints(session, query_hashes)
+
+        if not matches:
+            return []
+
+        candidates = await self._analyze_matches(
+            query_fingerprints, matches, min_match_count, top_k
+        )
+
+        metadata = await song_cache.get_many(
+            session, [candidate["song_id"] for candidate in candidates]
+        )
+        ranked = []
+        for candidate in candidates:
+            if candidate["song_id"] not in metadata:
+                logger.warning(f"Matched song {candidate['song_id']} has no metadata")
+                continue
+            candidate["title"], candidate["artist"] = metadata[candidate["song_id"]]
+            ranked.append(candidate)
+
+        return ranked
+
+    async def find_duplicate(
+        self, session: AsyncSession, fingerprints: List[Tuple[str, int]]
+    ) -> Optional[Dict[str, Any]]:
+        candidates = await self.match_fingerprints(
+            session,
+            fingerprints,
+            DUPLICATE_MIN_ALIGNED_MATCHES,
+            top_k=DUPLICATE_CANDIDATES,
+        )
+
+        for candidate in candidates:
+            if (
+                candidate["confidence"] < DUPLICATE_CONFIDENCE_THRESHOLD
+                or candidate["aligned_matches"] < DUPLICATE_MIN_ALIGNED_MATCHES
+            ):
+                # ranked by aligned matches, the rest can only score lower
+                break
+
+            catalog_count = await db_service.get_song_fingerprints_count(
+                session, candidate["song_id"]
+            )
+            coverage = (
+                candidate["aligned_matches"] / catalog_count if catalog_count else 0
+            )
+            if coverage >= DUPLICATE_COVERAGE_THRESHOLD:
+                candidate["coverage"] = coverage
+                return candidate
+
+        return None
+
     async def _analyze_matches(
         self,
         query_fingerprints: List[Tuple[str, int]],
         db_matches: List[Dict[str, Any]],
         min_match_count: int,
-    ) -> Optional[Dict[str, Any]]:
+        top_k: int = DEFAULT_TOP_K,
+    ) -> List[Dict[str, Any]]:
         return await asyncio.to_thread(
-            self._analyze_matches_sync, query_fingerprints, db_matches, min_match_count
+            self._analyze_matches_sync,
+            query_fingerprints,
+            db_matches,
+            min_match_count,
+            top_k,
         )
 
     def _analyze_matches_sync(
@@ -50,52 +135,79 @@ class AsyncRecognitionService:
         query_fingerprints: List[Tuple[str, int]],
         db_matches: List[Dict[str, Any]],
         min_match_count: int,
-    ) -> Optional[Dict[str, Any]]:
+        top_k: int = DEFAULT_TOP_K,
+    ) -> List[Dict[str, Any]]:
         query_offset_map = {fp_hash: offset for fp_hash, offset in query_fingerprints}
 
-        song_matches = defaultdict(list)
+        song_ids = []
+        song_index = {}
+        song_codes = []
+        time_diffs = []
 
         for match in db_matches:
             fp_hash = match["hash"]
             if fp_hash in query_offset_map:
-                query_offset = query_offset_map[fp_hash]
-                db_offset = match["offset"]
-                time_diff = db_offset - query_offset
-
-                song_matches[match["song_id"]].append(
-                    {
-                        "time_diff": time_diff,
-                        "title": match["title"],
-                        "artist": match["artist"],
-                    }
+                song_id = match["song_id"]
+                code = song_index.get(song_id)
+                if code is None:
+                    code = song_index[song_id] = len(song_ids)
+                    song_ids.append(song_id)
+
+                song_codes.append(code)
+                time_diffs.append(match["offset"] - query_offset_map[fp_hash])
+
+        if not song_codes:
+            return []
+
+        song_codes = np.asarray(song_codes, dtype=np.int64)
+        time_diffs = np.asarray(time_diffs, dtype=np.int64)
+        match_counts = np.bincount(song_codes, minlength=len(song_ids))
+
+        # one histogram bin per (song, time_diff) pair
+        order = np.lexsort((time_diffs, song_codes))
+        sorted_songs = song_codes[order]
+        sorted_diffs = time_diffs[order]
+        bin_starts = np.flatnonzero(
+            np.concatenate(
+                (
+                    [True],
+                    (sorted_songs[1:] != sorted_songs[:-1])
+                    | (sorted_diffs[1:] != sorted_diffs[:-1]),
                 )
-
-        best_song = None
-        best_confidence = 0
-
-        for song_id, song_match_list in song_matches.items():
-            if len(song_match_list) < min_match_count:
-                continue
-
-            time_diffs = [match["time_diff"] for match in song_match_list]
-            time_diff_counter = Counter(time_diffs)
-
-            most_common_diff, peak_count = time_diff_counter.most_common(1)[0]
-
-            confidence = peak_count / len(query_fingerprints)
-
-            if confidence > best_confidence:
-                best_confidence = confidence
-                best_song = {
-                    "song_id": song_id,
-                    "title": song_match_list[0]["title"],
-                    "artist": song_match_list[0]["artist"],
-                    "confidence": confidence,
-                    "aligned_matches": peak_count,
-                    "total_query_hashes": len(query_fingerprints),
-                }
-
-        return best_song
+            )
+        )
+        bin_counts = np.diff(np.append(bin_starts, len(sorted_songs)))
+        bin_songs = sorted_songs[bin_starts]
+        bin_diffs = sorted_diffs[bin_starts]
+
+        # tallest bin of each song's histogram
+        by_peak = np.lexsort((-bin_counts, bin_songs))
+        first_of_song = np.concatenate(
+            ([True], bin_songs[by_peak][1:] != bin_songs[by_peak][:-1])
+        )
+        peak_bins = by_peak[first_of_song]
+        peak_songs = bin_songs[peak_bins]
+        peak_counts = bin_counts[peak_bins]
+        peak_diffs = bin_diffs[peak_bins]
+
+        eligible = match_counts[peak_songs] >= min_match_count
+        peak_songs = peak_songs[eligible]
+        peak_counts = peak_counts[eligible]
+        peak_diffs = peak_diffs[eligible]
+
+        ranking = np.argsort(-peak_counts, kind="stable")[:top_k]
+        total_query_hashes = len(query_fingerprints)
+
+        return [
+            {
+                "song_id": song_ids[peak_songs[i]],
+                "confidence": int(peak_counts[i]) / total_query_hashes,
+                "aligned_matches": int(peak_counts[i]),
+                "offset_seconds": int(peak_diffs[i]) * HOP_LENGTH / TARGET_SR,
+                "total_query_hashes": total_query_hashes,
+            }
+            for i in ranking
+        ]
 
 
 recognition_service = AsyncRecognitionService()
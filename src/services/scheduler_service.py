@@ -0,0 +1,192 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+LANE_RECOGNIZE = "recognize"
+LANE_INGEST = "ingest"
+
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY") or 4)
+SCHEDULER_INGEST_MAX_CONCURRENCY = int(
+    os.getenv("SCHEDULER_INGEST_MAX_CONCURRENCY") or 1
+)
+RECOGNIZE_QUEUE_SIZE = int(os.getenv("RECOGNIZE_QUEUE_SIZE") or 32)
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE") or 64)
+RECOGNIZE_QUEUE_TIMEOUT = float(os.getenv("RECOGNIZE_QUEUE_TIMEOUT") or 5.0)
+
+
+class SchedulerOverloadedError(Exception):
+    def __init__(self, lane: str, reason: str):
+        super().__init__(f"{lane} queue {reason}")
+        self.lane = lane
+        self.reason = reason
+
+
+class _Lane:
+    def __init__(self, name: str, max_queue: int, max_active: int):
+        self.name = name
+        self.max_queue = max_queue
+        self.max_active = max_active
+        self.waiters: Deque[asyncio.Future] = deque()
+        # places held for work that was accepted but has not called admit yet
+        self.reserved = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self.waiters) + self.reserved
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self.waiters),
+            "reserved": self.reserved,
+            "active": self.active,
+            "max_queue": self.max_queue,
+            "max_active": self.max_active,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "average_wait_seconds": self.total_wait / self.admitted
+            if self.admitted > 0
+            else 0,
+        }
+
+
+class AsyncJobScheduler:
+    """Admission control in front of the fingerprint engine and the database.
+
+    Work is split into lanes with their own bounded wait queues. A freed slot
+    is always handed to a waiting recognition before a waiting ingestion, and
+    ingestion can never hold more than its own share of the slots.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = SCHEDULER_MAX_CONCURRENCY,
+        ingest_max_concurrency: int = SCHEDULER_INGEST_MAX_CONCURRENCY,
+        recognize_queue_size: int = RECOGNIZE_QUEUE_SIZE,
+        ingest_queue_size: int = INGEST_QUEUE_SIZE,
+    ):
+        self.max_concurrency = max_concurrency
+        # lanes are listed in priority order
+        self.lanes: Dict[str, _Lane] = {
+            LANE_RECOGNIZE: _Lane(
+                LANE_RECOGNIZE, recognize_queue_size, max_concurrency
+            ),
+            LANE_INGEST: _Lane(
+                LANE_INGEST,
+                ingest_queue_size,
+                min(ingest_max_concurrency, max_concurrency),
+            ),
+        }
+        self.active = 0
+
+    def reserve(self, lane_name: str) -> None:
+        # hold a queue place now for work that calls admit(reserved=True) later,
+        # so overload is reported before the request is accepted
+        lane = self.lanes[lane_name]
+        if lane.depth >= lane.max_queue:
+            lane.rejected += 1
+            raise SchedulerOverloadedError(lane.name, "is full")
+        lane.reserved += 1
+
+    def cancel_reservation(self, lane_name: str) -> None:
+        self.lanes[lane_name].reserved -= 1
+
+    def _can_start(self, lane: _Lane) -> bool:
+        if self.active >= self.max_concurrency or lane.active >= lane.max_active:
+            return False
+        # don't let a lower priority lane jump ahead of queued higher priority work
+        for other in self.lanes.values():
+            if other is lane:
+                return True
+            if other.waiters:
+                return False
+        return True
+
+    def _start(self, lane: _Lane, queued_at: float) -> None:
+        self.active += 1
+        lane.active += 1
+        lane.admitted += 1
+        lane.total_wait += time.monotonic() - queued_at
+
+    def _release(self, lane: _Lane) -> None:
+        self.active -= 1
+        lane.active -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for lane in self.lanes.values():
+            while (
+                lane.waiters
+                and self.active < self.max_concurrency
+                and lane.active < lane.max_active
+            ):
+                waiter = lane.waiters.popleft()
+                if waiter.done():
+                    continue
+                self.active += 1
+                lane.active += 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def admit(
+        self, lane_name: str, timeout: Optional[float] = None, reserved: bool = False
+    ):
+        lane = self.lanes[lane_name]
+        queued_at = time.monotonic()
+        if reserved:
+            lane.reserved -= 1
+
+        if self._can_start(lane):
+            self._start(lane, queued_at)
+        else:
+            if not reserved and lane.depth >= lane.max_queue:
+                lane.rejected += 1
+                raise SchedulerOverloadedError(lane.name, "is full")
+
+            waiter = asyncio.get_running_loop().create_future()
+            lane.waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except BaseException as e:
+                if waiter.done() and not waiter.cancelled():
+                    # slot was handed over right as we gave up, pass it on
+                    self._release(lane)
+                else:
+                    try:
+                        lane.waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                if isinstance(e, asyncio.TimeoutError):
+                    lane.timed_out += 1
+                    raise SchedulerOverloadedError(lane.name, "wait timed out")
+                raise
+
+            # slot counters were already taken by _dispatch
+            lane.admitted += 1
+            lane.total_wait += time.monotonic() - queued_at
+
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "lanes": {name: lane.metrics() for name, lane in self.lanes.items()},
+        }
+
+
+job_scheduler = AsyncJobScheduler()
@@ -0,0 +1,62 @@
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.model import Song
+
+logger = logging.getLogger(__name__)
+
+
+class SongMetadataCache:
+    """In-process song_id -> (title, artist) map.
+
+    Lets fingerprint lookups skip the songs join; metadata is only attached
+    to the winning candidates after scoring.
+    """
+
+    def __init__(self):
+        self._songs: Dict[UUID, Tuple[str, Optional[str]]] = {}
+        self.is_warm = False
+
+    async def warm(self, session: AsyncSession) -> None:
+        stmt = select(Song.id, Song.title, Song.artist)
+        result = await session.execute(stmt)
+        self._songs = {
+            song_id: (title, artist) for song_id, title, artist in result.all()
+        }
+        self.is_warm = True
+        logger.info(f"Song metadata cache warmed with {len(self._songs)} songs")
+
+    def put(self, song_id: UUID, title: str, artist: Optional[str]) -> None:
+        self._songs[song_id] = (title, artist)
+
+    def discard(self, song_id: UUID) -> None:
+        self._songs.pop(song_id, None)
+
+    async def get_many(
+        self, session: AsyncSession, song_ids: Iterable[UUID]
+    ) -> Dict[UUID, Tuple[str, Optional[str]]]:
+        song_ids = list(song_ids)
+        missing = [song_id for song_id in song_ids if song_id not in self._songs]
+        if missing:
+            # songs ingested by another process since we warmed up
+            stmt = select(Song.id, Song.title, Song.artist).where(
+                Song.id.in_(missing)
+            )
+            result = await session.execute(stmt)
+            for song_id, title, artist in result.all():
+                self._songs[song_id] = (title, artist)
+
+        return {
+            song_id: self._songs[song_id]
+            for song_id in song_ids
+            if song_id in self._songs
+        }
+
+    def __len__(self) -> int:
+        return len(self._songs)
+
+
+song_cache = SongMetadataCache()